@@ -4,6 +4,7 @@ Template for SNAP Dash apps.
 """
 import os
 import logging
+import time
 import dash
 import dash_dangerously_set_inner_html as ddsih
 from dash.dependencies import Input, Output
@@ -11,7 +12,16 @@ import dash_leaflet as dl
 import pyproj
 from jinja2 import Template
 from gui import layout, path_prefix
-from data import fetch_api_data, DASH_LOG_LEVEL
+from data import (
+    fetch_api_data,
+    breaker_status,
+    cached_point,
+    past_points,
+    refreshing,
+    UpstreamUnavailable,
+    UpstreamRequestError,
+    DASH_LOG_LEVEL,
+)
 import luts
 
 
@@ -26,8 +36,37 @@ app.layout = layout
 
 logging.basicConfig(level=getattr(logging, DASH_LOG_LEVEL.upper(), logging.INFO))
 
-# A list of lists containing past lat / lon combinations + associated data array
-past_points = []
+
+@application.route("/health/upstream")
+def upstream_health():
+    """
+    Exposes the API circuit breaker state for monitoring.
+    """
+    status = breaker_status()
+    status["cached_points"] = len(past_points)
+    status["refreshing"] = len(refreshing)
+    return status, 503 if status["state"] == "open" else 200
+
+
+def stale_status(fetched_at):
+    """
+    Builds the notice shown above the tables when serving stale cached data.
+    Inputs:
+        * fetched_at - Epoch time the cached data was retrieved.
+    Returns:
+        * Children and CSS style for the upstream_status Div.
+    """
+    if breaker_status()["state"] == "open":
+        detail = luts.stale_upstream_down_detail
+    else:
+        detail = luts.stale_refreshing_detail
+    fetched = time.strftime("on %Y-%m-%d at %H:%M UTC", time.gmtime(fetched_at))
+    return (
+        ddsih.DangerouslySetInnerHTML(
+            luts.stale_data_text.format(fetched=fetched, detail=detail)
+        ),
+        {"display": "block"},
+    )
 
 
 def generate_table_data(dt, gcm="GFDL-CM3", ts_str="2020-2049", units="imperial"):
@@ -163,6 +202,8 @@ def change_lon(click_lat_lng):
     Output("pf-data-tables", "children"),
     Output(component_id="above_tables", component_property="style"),
     Output(component_id="nan_values", component_property="style"),
+    Output("upstream_status", "children"),
+    Output(component_id="upstream_status", component_property="style"),
     [
         Input("lat-input", "value"),
         Input("lon-input", "value"),
@@ -173,6 +214,7 @@ def change_lon(click_lat_lng):
 def return_pf_data(lat, lon, ts_str, units):
     """
     Main function for generating the PF tables given all of the available inputs from the web application.
+    Cached data past CACHE_TTL is served immediately while a background refresh runs.
     Inputs:
         * lat - Value is latitude entered into lat-input Input field.
         * lon - Value is longitude entered into lon-input Input field.
@@ -183,42 +225,62 @@ def return_pf_data(lat, lon, ts_str, units):
            and in units requested.
         * A CSS style string for the text above the data table when given valid data.
         * A CSS style string for the text given when provided all NANs / outside of AOI.
+        * Children and a CSS style string for the data freshness / upstream outage notice.
     """
 
-    wgs84 = pyproj.CRS("EPSG:4326")
-    epsg3338 = pyproj.CRS("EPSG:3338")
-
-    for point in past_points:
-        if point[0] == lat and point[1] == lon:
-            logging.info("Using cached data for latitude %s and longitude %s", lat, lon)
-            if point[2][0][0][0][0][0].isnull().values:
-                return (
-                    False,
-                    {"display": "none"},
-                    {"display": "block"},
-                )
+    key = (lat, lon)
+    status = ([], {"display": "none"})
+
+    cached = cached_point(key)
+    if cached is not None:
+        logging.info("Using cached data for latitude %s and longitude %s", lat, lon)
+        fetched_at, pf_data, stale = cached
+        if stale:
+            status = stale_status(fetched_at)
+    else:
+        wgs84 = pyproj.CRS("EPSG:4326")
+        epsg3338 = pyproj.CRS("EPSG:3338")
+        x, y = pyproj.transform(wgs84, epsg3338, lat, lon)
+
+        try:
+            pf_data = fetch_api_data(x, y)
+        except UpstreamUnavailable as error:
+            logging.warning(
+                "No data for latitude %s and longitude %s: %s", lat, lon, error
+            )
             return (
-                generate_table(point[2], ts_str, units, lat, lon),
+                False,
+                {"display": "none"},
+                {"display": "none"},
+                ddsih.DangerouslySetInnerHTML(luts.upstream_down_text),
                 {"display": "block"},
+            )
+        except UpstreamRequestError as error:
+            logging.warning(
+                "Bad request for latitude %s and longitude %s: %s", lat, lon, error
+            )
+            return (
+                False,
+                {"display": "none"},
                 {"display": "none"},
+                ddsih.DangerouslySetInnerHTML(luts.request_error_text),
+                {"display": "block"},
             )
-
-    nad83_lat_lon = pyproj.transform(wgs84, epsg3338, lat, lon)
-
-    pf_data = fetch_api_data(nad83_lat_lon[0], nad83_lat_lon[1])
-    past_points.append([lat, lon, pf_data])
+        past_points[key] = [time.time(), x, y, pf_data]
 
     if pf_data[0][0][0][0][0].isnull().values:
         return (
             False,
             {"display": "none"},
             {"display": "block"},
+            *status,
         )
 
     return (
         generate_table(pf_data, ts_str, units, lat, lon),
         {"display": "block"},
         {"display": "none"},
+        *status,
     )
 
 
@@ -4,10 +4,15 @@ and caching community data.
 """
 # pylint: disable=C0103, E0401
 
+import http.client
+import urllib.error
 import urllib.parse
+import urllib.request
 import os
 import logging
 import pickle
+import threading
+import time
 
 DASH_LOG_LEVEL = os.getenv("DASH_LOG_LEVEL", default="info")
 logging.basicConfig(level=getattr(logging, DASH_LOG_LEVEL.upper(), logging.INFO))
@@ -15,6 +20,206 @@ logging.basicConfig(level=getattr(logging, DASH_LOG_LEVEL.upper(), logging.INFO)
 API_URL = os.getenv("API_URL", default="http://pan.snap.uaf.edu:3000/api/percentiles")
 logging.info("Using API url %s", API_URL)
 
+# Seconds to wait on the API before giving up on a request. This bounds
+# each socket operation and the time spent reading the response body, so
+# a request can take at most about twice this long in total.
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", default=10))
+
+# Seconds before cached data for a point is considered stale and refreshed.
+CACHE_TTL = float(os.getenv("CACHE_TTL", default=86400))
+
+# Consecutive API failures before the circuit breaker opens, and seconds
+# the breaker stays open before a single probe request is sent.
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", default=3))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", default=60))
+
+# Circuit breaker state: "closed" (calls go through), "open" (calls fail
+# fast) or "half-open" (one probe call is in flight). probe_point is the
+# (x, y) of the last failed call, reused by the scheduled probe.
+breaker_lock = threading.Lock()
+breaker = {
+    "state": "closed",
+    "failures": 0,
+    "opened_at": None,
+    "last_error": None,
+    "probe_point": None,
+}
+
+# Past points keyed by (lat, lon), each a list of
+# [time fetched, EPSG:3338 x, EPSG:3338 y, associated data array]
+past_points = {}
+
+# (lat, lon) keys with a background refresh in flight
+refreshing = set()
+refresh_lock = threading.Lock()
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised when the API is down or unreachable, or the circuit breaker is open.
+    """
+
+
+class UpstreamRequestError(Exception):
+    """
+    Raised when the API rejects a request or returns data that can't be read.
+    These don't count towards opening the circuit breaker.
+    """
+
+
+def breaker_status():
+    """
+    Returns a snapshot of the circuit breaker state for monitoring.
+    Returns:
+        * A dict with the breaker state, consecutive failure count,
+          last error message and seconds until the next probe (or None).
+    """
+    with breaker_lock:
+        status = dict(breaker)
+    del status["probe_point"]
+    retry_in = None
+    if status["state"] == "open":
+        retry_in = max(0, round(status["opened_at"] + BREAKER_RESET - time.time(), 1))
+    status["retry_in"] = retry_in
+    status["threshold"] = BREAKER_THRESHOLD
+    return status
+
+
+def _before_call():
+    """
+    Decides whether an API call may go through, moving an open breaker
+    to half-open once BREAKER_RESET seconds have passed.
+    Returns:
+        * True if this call is the half-open probe, False otherwise.
+    Raises UpstreamUnavailable if the call should fail fast.
+    """
+    with breaker_lock:
+        if breaker["state"] == "closed":
+            return False
+        if (
+            breaker["state"] == "open"
+            and time.time() - breaker["opened_at"] >= BREAKER_RESET
+        ):
+            logging.info("Circuit breaker half-open, probing API")
+            breaker["state"] = "half-open"
+            return True
+        last_error = breaker["last_error"]
+    raise UpstreamUnavailable("Circuit breaker is open, last error: %s" % last_error)
+
+
+def _record_success():
+    """
+    Closes the circuit breaker after a successful API call.
+    """
+    with breaker_lock:
+        if breaker["state"] != "closed":
+            logging.info("API recovered, closing circuit breaker")
+        breaker["state"] = "closed"
+        breaker["failures"] = 0
+        breaker["opened_at"] = None
+        breaker["last_error"] = None
+
+
+def _open_breaker():
+    """
+    Opens the circuit breaker and schedules the next probe.
+    Must be called with breaker_lock held.
+    """
+    breaker["state"] = "open"
+    breaker["opened_at"] = time.time()
+    schedule_probe()
+
+
+def _record_failure(error, point):
+    """
+    Counts an API outage, opening the circuit breaker once
+    BREAKER_THRESHOLD consecutive failures are reached or a probe fails.
+    Failures from calls still in flight when the breaker opened are ignored.
+    Inputs:
+        * error - The exception raised by the API call.
+        * point - The (x, y) of the failed call, reused by scheduled probes.
+    """
+    with breaker_lock:
+        if breaker["state"] == "open":
+            return
+        breaker["failures"] += 1
+        breaker["last_error"] = repr(error)
+        breaker["probe_point"] = point
+        if breaker["state"] == "half-open" or breaker["failures"] >= BREAKER_THRESHOLD:
+            logging.warning(
+                "Opening circuit breaker after %s failures: %r",
+                breaker["failures"],
+                error,
+            )
+            _open_breaker()
+
+
+def _release_probe():
+    """
+    Reopens the circuit breaker if a half-open probe ended without
+    recording a result, e.g. a non-outage error or an interrupted request,
+    so the next probe is retried after BREAKER_RESET seconds.
+    """
+    with breaker_lock:
+        if breaker["state"] == "half-open":
+            _open_breaker()
+
+
+def schedule_probe():
+    """
+    Starts a timer that probes the API once BREAKER_RESET seconds have
+    passed, so an open breaker recovers even when no users are requesting data.
+    """
+    timer = threading.Timer(BREAKER_RESET, probe_api)
+    timer.daemon = True
+    timer.start()
+
+
+def probe_api():
+    """
+    Re-sends the last failed request to check whether the API has recovered.
+    Success closes the circuit breaker; an outage reopens it and schedules
+    another probe.
+    """
+    with breaker_lock:
+        point = breaker["probe_point"]
+    if point is None:
+        return
+    try:
+        fetch_api_data(*point)
+    except (UpstreamUnavailable, UpstreamRequestError) as error:
+        logging.info("Scheduled API probe failed: %s", error)
+
+
+def _is_outage(error):
+    """
+    Returns True if the error means the API is down or unreachable, rather
+    than a problem with a single request such as an out-of-range point.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+def _read_response(response, deadline):
+    """
+    Reads the response body in chunks, giving up once the deadline passes
+    so a slowly trickling response can't hold a worker indefinitely.
+    Inputs:
+        * response - The response returned by urlopen.
+        * deadline - time.monotonic() value after which reading stops.
+    Returns:
+        * The response body as bytes.
+    """
+    chunks = []
+    while True:
+        chunk = response.read(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+        if time.monotonic() > deadline:
+            raise TimeoutError("API response took longer than %ss" % API_TIMEOUT)
+
 
 def fetch_api_data(x, y):
     """
@@ -39,13 +244,85 @@ def fetch_api_data(x, y):
               pf-lower - lower confidence interval)
           - interval = Return interval in years for which the precipitation variables represent:
               (2.0, 5.0, 10.0, 25.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+    Raises UpstreamUnavailable on connection errors, timeouts, truncated
+    or 5xx responses, or if the circuit breaker is open after repeated
+    outages. Raises UpstreamRequestError for any other failure, such as a
+    4xx response, which doesn't count towards opening the breaker.
     """
 
     logging.info("Calling fetch_api_data()")
 
+    probe = _before_call()
+
     values = {"xcoord": x, "ycoord": y}
     data = urllib.parse.urlencode(values)
-    response = urllib.request.urlopen(API_URL + "?" + data)
-    pkl = response.read()
-    data = pickle.loads(pkl)
+    try:
+        try:
+            deadline = time.monotonic() + API_TIMEOUT
+            response = urllib.request.urlopen(API_URL + "?" + data, timeout=API_TIMEOUT)
+            pkl = _read_response(response, deadline)
+            data = pickle.loads(pkl)
+        except Exception as error:  # pylint: disable=W0703
+            if _is_outage(error):
+                _record_failure(error, (x, y))
+                raise UpstreamUnavailable(repr(error)) from error
+            raise UpstreamRequestError(repr(error)) from error
+        _record_success()
+    finally:
+        if probe:
+            _release_probe()
+
     return data
+
+
+def refresh_point(key, x, y):
+    """
+    Re-fetches data for a cached point whose entry is past CACHE_TTL.
+    Runs in a background thread; on failure the stale entry is kept.
+    Inputs:
+        * key - The (lat, lon) key of the point in past_points.
+        * x - The X-coordinate in the EPSG:3338 coordinate system.
+        * y - The Y-coordinate in the EPSG:3338 coordinate system.
+    """
+    try:
+        past_points[key] = [time.time(), x, y, fetch_api_data(x, y)]
+        logging.info("Refreshed cached data for %s", key)
+    except (UpstreamUnavailable, UpstreamRequestError) as error:
+        logging.warning("Could not refresh cached data for %s: %s", key, error)
+    finally:
+        with refresh_lock:
+            refreshing.discard(key)
+
+
+def schedule_refresh(key, x, y):
+    """
+    Starts a background refresh for a cached point unless one is already running.
+    Returns:
+        * The started Thread, or None if a refresh was already running.
+    """
+    with refresh_lock:
+        if key in refreshing:
+            return None
+        refreshing.add(key)
+    thread = threading.Thread(target=refresh_point, args=(key, x, y), daemon=True)
+    thread.start()
+    return thread
+
+
+def cached_point(key):
+    """
+    Looks up cached data for a point, scheduling a background refresh
+    if the entry is older than CACHE_TTL.
+    Inputs:
+        * key - The (lat, lon) key of the point in past_points.
+    Returns:
+        * None if the point isn't cached, otherwise a tuple of
+          (time fetched, data array, whether the entry is stale).
+    """
+    if key not in past_points:
+        return None
+    fetched_at, x, y, pf_data = past_points[key]
+    stale = time.time() - fetched_at >= CACHE_TTL
+    if stale:
+        schedule_refresh(key, x, y)
+    return fetched_at, pf_data, stale
@@ -162,6 +162,12 @@ nan_values = html.Div(
     ],
 )
 
+upstream_status = html.Div(
+    id="upstream_status",
+    className="is-size-5",
+    style={"display": "none"},
+)
+
 above_tables = html.Div(
     id="above_tables",
     className="is-size-5",
@@ -185,6 +191,7 @@ data_table = wrap_in_section(
         children=[
             dcc.Loading(
                 children=[
+                    upstream_status,
                     nan_values,
                     above_tables,
                     html.Div(id="pf-data-tables"),
@@ -85,6 +85,29 @@ DURATIONS = [
 
 INTERVALS = [2, 5, 10, 25, 50, 100, 200, 500, 1000]
 
+# Shown in place of the tables when the API can't be reached
+# and there is no cached data for the selected point.
+upstream_down_text = """
+<h3 class="title is-4">⚠️ Data service temporarily unavailable</h3>
+<p>Sorry, we can't reach the service that provides this data right now. Please try again in a few minutes.</p>
+"""
+
+# Shown in place of the tables when the API rejects the request for
+# the selected point, where retrying won't help.
+request_error_text = """
+<h3 class="title is-4">⚠️ Data could not be loaded for this location</h3>
+<p>Sorry, we couldn't get data for the place you selected. Please check the latitude and longitude, or select a different point on the map.</p>
+"""
+
+# Shown above the tables when cached data past CACHE_TTL is being served.
+stale_data_text = """
+<p><strong>These results were retrieved {fetched}.</strong> {detail}</p>
+"""
+stale_refreshing_detail = "Updated data is being fetched and will appear the next time you load this location."
+stale_upstream_down_detail = (
+    "The data service is temporarily unavailable, so they may be out of date."
+)
+
 # Jinja template
 table_template = """
 <table class="table">
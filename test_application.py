@@ -0,0 +1,139 @@
+# pylint: disable=C0103,W0621
+"""
+Tests for the upstream status notices and health check in application.py.
+"""
+
+import calendar
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+pytest.importorskip("dash")
+
+import application  # pylint: disable=C0413
+import data  # pylint: disable=C0413
+import luts  # pylint: disable=C0413
+
+HIDDEN = {"display": "none"}
+SHOWN = {"display": "block"}
+
+
+class PfData:
+    """
+    Stands in for a data array with no missing values.
+    """
+
+    def __getitem__(self, _):
+        return self
+
+    def isnull(self):
+        return type("Null", (), {"values": False})()
+
+
+def fail(*args, **kwargs):
+    raise urllib.error.URLError("connection refused")
+
+
+@pytest.fixture(autouse=True)
+def reset_state(monkeypatch):
+    """
+    Gives each test a closed breaker, an empty cache and no real API calls.
+    """
+    monkeypatch.setitem(data.breaker, "state", "closed")
+    monkeypatch.setitem(data.breaker, "failures", 0)
+    monkeypatch.setitem(data.breaker, "opened_at", None)
+    monkeypatch.setitem(data.breaker, "last_error", None)
+    monkeypatch.setitem(data.breaker, "probe_point", None)
+    monkeypatch.setattr(data, "schedule_probe", lambda: None)
+    monkeypatch.setattr(urllib.request, "urlopen", fail)
+    monkeypatch.setattr(application, "generate_table", lambda *a: ["table"])
+    data.past_points.clear()
+    data.refreshing.clear()
+
+
+def open_breaker(monkeypatch):
+    monkeypatch.setitem(data.breaker, "state", "open")
+    monkeypatch.setitem(data.breaker, "opened_at", time.time())
+
+
+def html(component):
+    return component.to_plotly_json()["props"]["children"]
+
+
+def test_fresh_entry_has_no_notice():
+    data.past_points[(64.8, -147.7)] = [time.time(), 10, 20, PfData()]
+    result = application.return_pf_data(64.8, -147.7, "2020-2049", "imperial")
+    assert result == (["table"], SHOWN, HIDDEN, [], HIDDEN)
+
+
+def test_stale_notice_while_refreshing(monkeypatch):
+    monkeypatch.setattr(data, "CACHE_TTL", 60)
+    fetched_at = calendar.timegm((2026, 1, 2, 3, 4, 0))
+    data.past_points[(64.8, -147.7)] = [fetched_at, 10, 20, PfData()]
+
+    tables, above, nan, notice, style = application.return_pf_data(
+        64.8, -147.7, "2020-2049", "imperial"
+    )
+
+    assert (tables, above, nan, style) == (["table"], SHOWN, HIDDEN, SHOWN)
+    assert "retrieved on 2026-01-02 at 03:04 UTC" in html(notice)
+    assert luts.stale_refreshing_detail in html(notice)
+
+
+def test_stale_notice_while_upstream_down(monkeypatch):
+    open_breaker(monkeypatch)
+    monkeypatch.setattr(data, "CACHE_TTL", 60)
+    data.past_points[(64.8, -147.7)] = [time.time() - 120, 10, 20, PfData()]
+
+    *_, notice, style = application.return_pf_data(
+        64.8, -147.7, "2020-2049", "imperial"
+    )
+
+    assert style == SHOWN
+    assert luts.stale_upstream_down_detail in html(notice)
+
+
+def test_fails_fast_without_cached_entry(monkeypatch):
+    open_breaker(monkeypatch)
+    calls = []
+    monkeypatch.setattr(urllib.request, "urlopen", lambda *a, **k: calls.append(1))
+
+    tables, above, nan, notice, style = application.return_pf_data(
+        64.8, -147.7, "2020-2049", "imperial"
+    )
+
+    assert (tables, above, nan, style) == (False, HIDDEN, HIDDEN, SHOWN)
+    assert html(notice) == luts.upstream_down_text
+    assert not calls
+    assert not data.past_points
+
+
+def test_request_error_is_not_reported_as_outage(monkeypatch):
+    def bad_request(*args, **kwargs):
+        raise urllib.error.HTTPError("url", 400, "Bad Request", {}, None)
+
+    monkeypatch.setattr(urllib.request, "urlopen", bad_request)
+
+    tables, above, nan, notice, style = application.return_pf_data(
+        64.8, -147.7, "2020-2049", "imperial"
+    )
+
+    assert (tables, above, nan, style) == (False, HIDDEN, HIDDEN, SHOWN)
+    assert html(notice) == luts.request_error_text
+    assert data.breaker_status()["state"] == "closed"
+
+
+def test_health_check(monkeypatch):
+    client = application.application.test_client()
+
+    response = client.get("/health/upstream")
+    assert response.status_code == 200
+    assert response.get_json()["state"] == "closed"
+
+    open_breaker(monkeypatch)
+    response = client.get("/health/upstream")
+    assert response.status_code == 503
+    assert response.get_json()["state"] == "open"
+    assert "probe_point" not in response.get_json()
@@ -0,0 +1,236 @@
+# pylint: disable=C0103,W0621
+"""
+Tests for the API circuit breaker and stale-while-revalidate cache in data.py.
+"""
+
+import http.client
+import io
+import pickle
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import data
+
+REAL_SCHEDULE_PROBE = data.schedule_probe
+
+
+class FakeResponse(io.BytesIO):
+    """
+    Stands in for the urlopen response, returning a pickled payload.
+    """
+
+    def __init__(self, payload):
+        super().__init__(pickle.dumps(payload))
+
+
+def fail(*args, **kwargs):
+    raise urllib.error.URLError("connection refused")
+
+
+def succeed(*args, **kwargs):
+    return FakeResponse({"ok": True})
+
+
+@pytest.fixture(autouse=True)
+def reset_state(monkeypatch):
+    """
+    Gives each test a closed breaker and an empty cache.
+    """
+    monkeypatch.setitem(data.breaker, "state", "closed")
+    monkeypatch.setitem(data.breaker, "failures", 0)
+    monkeypatch.setitem(data.breaker, "opened_at", None)
+    monkeypatch.setitem(data.breaker, "last_error", None)
+    monkeypatch.setitem(data.breaker, "probe_point", None)
+    monkeypatch.setattr(data, "schedule_probe", lambda: None)
+    monkeypatch.setattr(data, "BREAKER_THRESHOLD", 3)
+    monkeypatch.setattr(data, "BREAKER_RESET", 60)
+    data.past_points.clear()
+    data.refreshing.clear()
+
+
+def trip_breaker(monkeypatch):
+    monkeypatch.setattr(urllib.request, "urlopen", fail)
+    for _ in range(data.BREAKER_THRESHOLD):
+        with pytest.raises(data.UpstreamUnavailable):
+            data.fetch_api_data(1, 2)
+
+
+def test_opens_at_threshold(monkeypatch):
+    monkeypatch.setattr(urllib.request, "urlopen", fail)
+    for _ in range(data.BREAKER_THRESHOLD - 1):
+        with pytest.raises(data.UpstreamUnavailable):
+            data.fetch_api_data(1, 2)
+    assert data.breaker_status()["state"] == "closed"
+
+    with pytest.raises(data.UpstreamUnavailable):
+        data.fetch_api_data(1, 2)
+    status = data.breaker_status()
+    assert status["state"] == "open"
+    assert status["failures"] == data.BREAKER_THRESHOLD
+
+
+def test_fails_fast_while_open(monkeypatch):
+    trip_breaker(monkeypatch)
+    calls = []
+    monkeypatch.setattr(urllib.request, "urlopen", lambda *a, **k: calls.append(1))
+    with pytest.raises(data.UpstreamUnavailable, match="Circuit breaker is open"):
+        data.fetch_api_data(1, 2)
+    assert not calls
+
+
+def test_late_failures_while_open_are_ignored(monkeypatch):
+    trip_breaker(monkeypatch)
+    opened_at = data.breaker["opened_at"]
+    data._record_failure(OSError("timed out"), (1, 2))  # pylint: disable=W0212
+    assert data.breaker["opened_at"] == opened_at
+    assert data.breaker["failures"] == data.BREAKER_THRESHOLD
+
+
+def test_request_errors_do_not_count(monkeypatch):
+    def bad_request(*args, **kwargs):
+        raise urllib.error.HTTPError("url", 400, "Bad Request", {}, None)
+
+    monkeypatch.setattr(urllib.request, "urlopen", bad_request)
+    for _ in range(data.BREAKER_THRESHOLD + 1):
+        with pytest.raises(data.UpstreamRequestError):
+            data.fetch_api_data(float("inf"), 2)
+    assert data.breaker_status()["state"] == "closed"
+    assert data.breaker_status()["failures"] == 0
+
+
+def test_server_errors_count(monkeypatch):
+    def server_error(*args, **kwargs):
+        raise urllib.error.HTTPError("url", 502, "Bad Gateway", {}, None)
+
+    monkeypatch.setattr(urllib.request, "urlopen", server_error)
+    for _ in range(data.BREAKER_THRESHOLD):
+        with pytest.raises(data.UpstreamUnavailable):
+            data.fetch_api_data(1, 2)
+    assert data.breaker_status()["state"] == "open"
+
+
+def test_truncated_response_counts(monkeypatch):
+    def truncated(*args, **kwargs):
+        raise http.client.IncompleteRead(b"partial")
+
+    monkeypatch.setattr(urllib.request, "urlopen", truncated)
+    for _ in range(data.BREAKER_THRESHOLD):
+        with pytest.raises(data.UpstreamUnavailable):
+            data.fetch_api_data(1, 2)
+    assert data.breaker_status()["state"] == "open"
+
+
+def test_slow_response_hits_deadline(monkeypatch):
+    class Trickle:
+        def read(self, _):
+            time.sleep(0.01)
+            return b"x"
+
+    monkeypatch.setattr(data, "API_TIMEOUT", 0.05)
+    monkeypatch.setattr(urllib.request, "urlopen", lambda *a, **k: Trickle())
+    started = time.monotonic()
+    with pytest.raises(data.UpstreamUnavailable, match="longer than"):
+        data.fetch_api_data(1, 2)
+    assert time.monotonic() - started < 1
+    assert data.breaker_status()["failures"] == 1
+
+
+def test_probe_success_closes(monkeypatch):
+    trip_breaker(monkeypatch)
+    monkeypatch.setattr(data, "BREAKER_RESET", 0)
+    monkeypatch.setattr(urllib.request, "urlopen", succeed)
+    assert data.fetch_api_data(1, 2) == {"ok": True}
+    status = data.breaker_status()
+    assert status["state"] == "closed"
+    assert status["failures"] == 0
+
+
+def test_probe_failure_reopens(monkeypatch):
+    trip_breaker(monkeypatch)
+    first_opened_at = data.breaker["opened_at"]
+    monkeypatch.setattr(data, "BREAKER_RESET", 0)
+    with pytest.raises(data.UpstreamUnavailable):
+        data.fetch_api_data(1, 2)
+    assert data.breaker_status()["state"] == "open"
+    assert data.breaker["opened_at"] >= first_opened_at
+
+
+def test_interrupted_probe_reopens(monkeypatch):
+    trip_breaker(monkeypatch)
+    monkeypatch.setattr(data, "BREAKER_RESET", 0)
+
+    def interrupted(*args, **kwargs):
+        assert data.breaker["state"] == "half-open"
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(urllib.request, "urlopen", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        data.fetch_api_data(1, 2)
+    assert data.breaker_status()["state"] == "open"
+
+
+def test_scheduled_probe_closes_without_traffic(monkeypatch):
+    monkeypatch.setattr(data, "schedule_probe", REAL_SCHEDULE_PROBE)
+    monkeypatch.setattr(data, "BREAKER_RESET", 0.05)
+    trip_breaker(monkeypatch)
+    monkeypatch.setattr(urllib.request, "urlopen", succeed)
+
+    deadline = time.time() + 5
+    while data.breaker_status()["state"] != "closed" and time.time() < deadline:
+        time.sleep(0.01)
+
+    status = data.breaker_status()
+    assert status["state"] == "closed"
+    assert status["retry_in"] is None
+    assert "probe_point" not in status
+
+
+def test_fresh_entry_is_not_refreshed(monkeypatch):
+    monkeypatch.setattr(urllib.request, "urlopen", fail)
+    data.past_points[(1, 2)] = [time.time(), 10, 20, "cached"]
+    assert data.cached_point((1, 2))[1:] == ("cached", False)
+    assert not data.refreshing
+
+
+def test_stale_entry_served_with_single_refresh(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def slow(*args, **kwargs):
+        calls.append(1)
+        release.wait(5)
+        return FakeResponse("fresh")
+
+    monkeypatch.setattr(urllib.request, "urlopen", slow)
+    monkeypatch.setattr(data, "CACHE_TTL", 60)
+    fetched_at = time.time() - 120
+    data.past_points[(1, 2)] = [fetched_at, 10, 20, "stale"]
+
+    for _ in range(3):
+        assert data.cached_point((1, 2)) == (fetched_at, "stale", True)
+    assert data.schedule_refresh((1, 2), 10, 20) is None
+
+    release.set()
+    deadline = time.time() + 5
+    while data.refreshing and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert len(calls) == 1
+    assert data.cached_point((1, 2))[1:] == ("fresh", False)
+
+
+def test_failed_refresh_keeps_stale_entry(monkeypatch):
+    monkeypatch.setattr(urllib.request, "urlopen", fail)
+    monkeypatch.setattr(data, "CACHE_TTL", 60)
+    entry = [time.time() - 120, 10, 20, "stale"]
+    data.past_points[(1, 2)] = entry
+
+    thread = data.schedule_refresh((1, 2), 10, 20)
+    thread.join(5)
+
+    assert data.past_points[(1, 2)] is entry
+    assert not data.refreshing